@@ -6,7 +6,16 @@ import plotly.express as px
 import pydeck as pdk
 from datetime import date
 import plotly.graph_objects as go
-from scripts.data_loader import get_all_datasets, apply_global_filters
+import plotly.io as pio
+from scripts.data_loader import (
+    FILTER_MAP,
+    get_all_datasets,
+    apply_global_filters,
+    load_csv,
+    filter_key,
+    grouped_sum,
+    load_filtered,
+)
 from scripts.ui_utils import (
     init_session_state,
     metric_card,
@@ -16,16 +25,41 @@ from scripts.ui_utils import (
 
 st.set_page_config(page_title="Promotion Performance Dashboard", layout="wide")
 
+
+@st.cache_data(show_spinner=False)
+def _css() -> str:
+    with open(os.path.join("assets", "style.css"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
 # Inject CSS
-with open(os.path.join("assets", "style.css"), "r", encoding="utf-8") as f:
-    st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+st.markdown(f"<style>{_css()}</style>", unsafe_allow_html=True)
 
 init_session_state()
 
+# Columns summed for the KPI panel
+KPI_METRICS = [
+    "revenue_before_promo",
+    "revenue_after_promo",
+    "quantity_sold (before_promo)",
+    "quantity_sold (after_promo)",
+]
+
 
 @st.cache_data(show_spinner=False)
 def load_data():
-    return get_all_datasets()
+    datasets = get_all_datasets()
+    # Pre-aggregate KPI metrics per filter combination so the KPI panel sums a
+    # small cube instead of the row-level frame. A large clean_all is left out
+    # of get_all_datasets, so only the cube's columns are read for it
+    clean_all = datasets.get("clean_all")
+    if clean_all is None:
+        clean_all = load_csv("clean_all", columns=[*FILTER_MAP, *KPI_METRICS])
+    if set(FILTER_MAP).union(KPI_METRICS).issubset(clean_all.columns):
+        datasets["kpi_cube"] = clean_all.groupby(
+            list(FILTER_MAP), as_index=False, observed=True
+        )[KPI_METRICS].sum()
+    return datasets
 
 
 datasets = load_data()
@@ -37,6 +71,7 @@ events = datasets.get("event_data", pd.DataFrame())
 clean_revenue = datasets.get("clean_revenue", pd.DataFrame())
 city_sales = datasets.get("city_sales", pd.DataFrame())
 clean_all = datasets.get("clean_all", pd.DataFrame())
+kpi_cube = datasets.get("kpi_cube", clean_all)
 
 
 # ------- TOP-LEVEL FILTERS -------
@@ -50,21 +85,19 @@ col1, col2, col3, col4, col5, col6 = st.columns(6)
 def safe_unique(series):
     if series is None or series.empty:
         return []
+    # Categories are already unique and sorted; no need to scan the values
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.categories.tolist()
     return sorted(series.dropna().unique().tolist())
 
 
-# Initialize session_state defaults only once
-default_state = {
-    "campaigns": [],
-    "categories": [],
-    "products": [],
-    "promo_types": [],
-    "cities": [],
-    "kpi_focus": "Revenue",
-}
-for key, default in default_state.items():
-    if key not in st.session_state:
-        st.session_state[key] = default
+# Cached per dataset/column so reruns skip rebuilding the option lists. Reads
+# the datasets already loaded above: calling the cached load_data from here
+# would replay its warnings. A large clean_all is not loaded whole, but the
+# KPI cube holds its filter columns
+@st.cache_data(show_spinner=False)
+def unique_sorted(alias: str, col: str) -> list:
+    return safe_unique(datasets.get(alias, kpi_cube).get(col, pd.Series()))
 
 
 # -----------------------------
@@ -74,7 +107,7 @@ for key, default in default_state.items():
 with col1:
     st.session_state["campaigns"] = st.multiselect(
         "🎯 Campaign",
-        options=safe_unique(clean_all.get("campaign_id", pd.Series())),
+        options=unique_sorted("clean_all", "campaign_id"),
         default=st.session_state["campaigns"],
         help="Select one or more campaigns to filter data.",
     )
@@ -82,7 +115,7 @@ with col1:
 with col2:
     st.session_state["categories"] = st.multiselect(
         "📦 Category",
-        options=safe_unique(clean_all.get("category", pd.Series())),
+        options=unique_sorted("clean_all", "category"),
         default=st.session_state["categories"],
         help="Filter data based on product category.",
     )
@@ -90,7 +123,7 @@ with col2:
 with col3:
     st.session_state["products"] = st.multiselect(
         "🛍️ Product",
-        options=safe_unique(clean_all.get("product_name", pd.Series())),
+        options=unique_sorted("clean_all", "product_name"),
         default=st.session_state["products"],
         help="Filter data by product names.",
     )
@@ -98,7 +131,7 @@ with col3:
 with col4:
     st.session_state["promo_types"] = st.multiselect(
         "🏷️ Promo Type",
-        options=safe_unique(clean_all.get("promo_type", pd.Series())),
+        options=unique_sorted("clean_all", "promo_type"),
         default=st.session_state["promo_types"],
         help="Choose the type of promotion (e.g., Discount, Combo).",
     )
@@ -106,7 +139,7 @@ with col4:
 with col5:
     st.session_state["cities"] = st.multiselect(
         "🌆 City",
-        options=safe_unique(clean_all.get("city", pd.Series())),
+        options=unique_sorted("clean_all", "city"),
         default=st.session_state["cities"],
         help="Filter sales data by city.",
     )
@@ -127,44 +160,21 @@ with col6:
 # ------- CENTER + RIGHT PANELS -------
 center, right = st.columns([2, 1])
 
-# -------------------------------
-# 1️⃣ Initialize default session_state keys
-# -------------------------------
-default_state = {
-    "campaigns": [],
-    "categories": [],
-    "products": [],
-    "promo_types": [],
-    "cities": [],
-    "kpi_focus": "Revenue",
-    "discount_range": (0.0, 1.0),
-    "price_range": (0.0, 1000.0),
-    "inc_rev_range": (0.0, 100000.0),
-    "ir_range": (0.0, 1.0),
-    "show_before": True,
-    "show_after": True,
-    "positive_only": False,
-    "normalize_store": False,
-    "top_n": 10,
-    "selected_city": "All",
-}
-
-for key, default in default_state.items():
-    if key not in st.session_state:
-        st.session_state[key] = default
 # -------------------------------------------------------------------------------------------------------------
 # Apply global filters to dataframes where applicable
-filtered_clean_revenue = apply_global_filters(clean_revenue, dict(st.session_state))
-filtered_city_sales = apply_global_filters(city_sales, dict(st.session_state))
-filtered_clean_all = apply_global_filters(clean_all, dict(st.session_state))
+filter_signature = filter_key(st.session_state)
+filtered_clean_revenue = load_filtered("clean_revenue", filter_signature)
+filtered_city_sales = load_filtered("city_sales", filter_signature)
+filtered_clean_all = load_filtered("clean_all", filter_signature)
+# City focus shared by the KPI panel and the treemap
+focus_city = st.session_state.get("selected_city")
 
 with right:
     st.subheader("KPI Summary")
 
-    # City-scoped dataframe
-    scope_df = filtered_clean_all
+    # City-scoped KPI cube (falls back to row-level data if it could not be built)
+    scope_df = apply_global_filters(kpi_cube, st.session_state)
     # Apply city filter
-    focus_city = st.session_state.get("selected_city")
     if focus_city and focus_city != "All" and "city" in scope_df.columns:
         scope_df = scope_df[scope_df["city"] == focus_city]
 
@@ -199,41 +209,6 @@ with right:
         metric_card("Units After", f"{total_units_after:,}")
         metric_card("Incremental Sold Units %", f"{isu_percent:.1f}%")
 
-# dont touchh
-total_before = scope_df["revenue_before_promo"].sum()
-total_after = scope_df["revenue_after_promo"].sum()
-ir_percent = (total_after - total_before) / total_before * 100
-total_units_before = scope_df["quantity_sold (before_promo)"].sum()
-total_units_after = scope_df["quantity_sold (after_promo)"].sum()
-isu_percent = (total_units_after - total_units_before) / total_units_before * 100
-
-# -----------------------------------------
-
-
-# Optional: Filter by selected campaigns/products
-df_filtered = clean_all.copy()
-if "campaigns" in st.session_state and st.session_state["campaigns"]:
-    df_filtered = df_filtered[
-        df_filtered["campaign_id"].isin(st.session_state["campaigns"])
-    ]
-if "products" in st.session_state and st.session_state["products"]:
-    df_filtered = df_filtered[
-        df_filtered["product_name"].isin(st.session_state["products"])
-    ]
-
-
-y_values = [total_before, total_after]
-y_text = [f"₹{total_before:,.0f}", f"₹{total_after:,.0f}"]
-y_label = "Revenue (₹)"
-ir_label = "Incremental Revenue %"
-ir_value = ir_percent
-
-y_values = [total_units_before, total_units_after]
-y_text = [f"{total_units_before:,}", f"{total_units_after:,}"]
-y_label = "Units Sold"
-ir_label = "Incremental Sold Units %"
-ir_value = isu_percent
-
 # -------------------------
 # KPI focus (Revenue or Units) GRAPHGRAPHGRAPHGRAPHGRAPHGRAPHGRAPHGRAPHGRAPH
 # -------------------------
@@ -293,29 +268,23 @@ fig_kpi.update_layout(
     template="plotly_white",
     width=700,
     height=450,
+    uirevision="kpi",
 )
 
 st.plotly_chart(fig_kpi, use_container_width=True)
 
 
-# -------------------------------
-# TREEMAP: Hierarchical Performance Breakdown
-# -------------------------------
-st.subheader("Treemap View")
-
-if not filtered_clean_all.empty and set(
-    ["campaign_id", "product_name", "promo_type", "incremental_margin%"]
-).issubset(filtered_clean_all.columns):
-
-    treemap_df = filtered_clean_all.copy()
+# Built in a cached function keyed by the filter signature and the chart's
+# inputs, and returned as JSON so reruns skip figure construction
+@st.cache_data(show_spinner=False)
+def build_treemap(signature: tuple, kpi_focus: str, focus_city: str | None) -> str:
+    treemap_df = load_filtered("clean_all", signature)
 
     # Apply city-level filter if selected
     if focus_city and focus_city != "All" and "city" in treemap_df.columns:
         treemap_df = treemap_df[treemap_df["city"] == focus_city]
 
     # KPI Focus switch (Revenue / Units)
-    kpi_focus = st.session_state.get("kpi_focus", "Revenue")
-
     if kpi_focus == "Revenue":
         value_col = "revenue_after_promo"
         title_metric = "Revenue (₹)"
@@ -326,10 +295,24 @@ if not filtered_clean_all.empty and set(
     # Ensure no missing values
     treemap_df = treemap_df.dropna(subset=[value_col, "incremental_margin%"])
 
+    # Pre-aggregate to one row per leaf so Plotly only serialises the leaves;
+    # leaf colour is the value-weighted margin, as px derives it from rows
+    treemap_path = ["campaign_id", "product_name", "promo_type"]
+    treemap_df = treemap_df.assign(
+        _weighted_margin=treemap_df["incremental_margin%"] * treemap_df[value_col]
+    )
+    treemap_df = grouped_sum(treemap_df, treemap_path, [value_col, "_weighted_margin"])
+    treemap_df["incremental_margin%"] = (
+        treemap_df.pop("_weighted_margin") / treemap_df[value_col]
+    )
+
+    # px hierarchies group without observed=True, so hand them plain labels
+    treemap_df = treemap_df.astype({col: str for col in treemap_path})
+
     # Build Treemap
     fig_treemap = px.treemap(
         treemap_df,
-        path=["campaign_id", "product_name", "promo_type"],
+        path=treemap_path,
         values=value_col,
         color="incremental_margin%",
         color_continuous_scale="RdYlGn",
@@ -345,8 +328,26 @@ if not filtered_clean_all.empty and set(
         margin=dict(t=60, l=0, r=0, b=0),
         height=500,
         template="plotly_white",
+        uirevision="treemap",
     )
 
+    return fig_treemap.to_json()
+
+
+# -------------------------------
+# TREEMAP: Hierarchical Performance Breakdown
+# -------------------------------
+st.subheader("Treemap View")
+
+if not filtered_clean_all.empty and set(
+    ["campaign_id", "product_name", "promo_type", "incremental_margin%"]
+).issubset(filtered_clean_all.columns):
+
+    # KPI Focus switch (Revenue / Units)
+    kpi_focus = st.session_state.get("kpi_focus", "Revenue")
+
+    fig_treemap = pio.from_json(build_treemap(filter_signature, kpi_focus, focus_city))
+
     st.plotly_chart(fig_treemap, use_container_width=True)
 
 else:
@@ -374,8 +375,56 @@ meaning it performed very well with the **BOGOF** offer.
 
 # GEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEEOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOOO
 
+# Bin city points to a coarse lat/lng grid so the map only ships one point per
+# city per cell, however many rows city_sales holds. Cells are keyed on the
+# rounded lat_b/lng_b but plotted at the quantity-weighted mean of the real
+# coordinates, so a city with a single row keeps its exact position
+@st.cache_data(show_spinner=False)
+def binned_city_sales(signature: tuple, precision: int = 1) -> pd.DataFrame:
+    df = load_filtered("city_sales", signature)
+    if df.empty or not {"lat", "lng", "city"}.issubset(df.columns):
+        return df
+    weights = [
+        col
+        for col in (
+            "total_quantity_sold",
+            "quantity_before_promo",
+            "quantity_after_promo",
+            "revenue_after_promo",
+        )
+        if col in df.columns
+    ]
+    helpers = ["_rows", "_weight", "_lat", "_lng", "_lat_sum", "_lng_sum"]
+    weight = (
+        df["total_quantity_sold"].clip(lower=0).fillna(0)
+        if "total_quantity_sold" in df.columns
+        else pd.Series(0.0, index=df.index)
+    )
+    binned = grouped_sum(
+        df.assign(
+            lat_b=df["lat"].round(precision),
+            lng_b=df["lng"].round(precision),
+            _rows=1,
+            _weight=weight,
+            _lat=df["lat"] * weight,
+            _lng=df["lng"] * weight,
+            _lat_sum=df["lat"],
+            _lng_sum=df["lng"],
+        ),
+        ["lat_b", "lng_b", "city"],
+        [*weights, *helpers],
+    )
+    # Cells without quantity fall back to the plain mean of their coordinates
+    weighted = binned["_weight"] > 0
+    for col in ("lat", "lng"):
+        binned[col] = (binned[f"_{col}"] / binned["_weight"]).where(
+            weighted, binned[f"_{col}_sum"] / binned["_rows"]
+        )
+    return binned.drop(columns=["lat_b", "lng_b", *helpers])
+
+
 # Prepare data for visuals using filtered data
-map_df = filtered_city_sales.copy()
+map_df = binned_city_sales(filter_signature)
 if not map_df.empty:
     # Decide color metric by KPI
     kpi = st.session_state.get("kpi_focus", "Revenue").lower()
@@ -393,7 +442,9 @@ if not map_df.empty:
         )
     )
 
-with center:
+# Map widgets only rerun this fragment, not the whole dashboard
+@st.fragment
+def render_city_map():
     st.subheader("Geospatial Performance")
     # Controls for map type before rendering
     map_mode = st.radio(
@@ -439,3 +490,7 @@ with center:
                 tooltip={"text": "{city}\nQty: {total_quantity_sold}"},
             )
         )
+
+
+with center:
+    render_city_map()
@@ -1,9 +1,16 @@
 from __future__ import annotations
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from scripts.data_loader import get_all_datasets, apply_global_filters
+import plotly.io as pio
+from scripts.data_loader import (
+    get_all_datasets,
+    filter_key,
+    grouped_sum,
+    load_filtered,
+)
 from scripts.ui_utils import init_session_state
 import networkx as nx
 
@@ -27,40 +34,44 @@ city_sales = datasets.get("city_sales", pd.DataFrame())
 clean_all = datasets.get("clean_all", pd.DataFrame())
 
 
-filtered_clean_revenue = apply_global_filters(clean_revenue, dict(st.session_state))
-filtered_city_sales = apply_global_filters(city_sales, dict(st.session_state))
-filtered_clean_all = apply_global_filters(clean_all, dict(st.session_state))
+filter_signature = filter_key(st.session_state)
+filtered_clean_revenue = load_filtered("clean_revenue", filter_signature)
+filtered_city_sales = load_filtered("city_sales", filter_signature)
+filtered_clean_all = load_filtered("clean_all", filter_signature)
+
 
+# Widget bounds/options derived from the filtered frame, cached per filter
+# signature so dragging a slider does not rescan the data
+@st.cache_data(show_spinner=False)
+def column_max(signature: tuple, col: str) -> int:
+    return int(load_filtered("clean_all", signature)[col].max())
 
-# Check required columns
-required_cols = ["campaign_id", "promo_type", "category", "incremental_margin%", "city"]
-if (
-    set(required_cols).issubset(filtered_clean_all.columns)
-    and not filtered_clean_all.empty
-):
 
-    # Optional filters
-    with st.expander("🔍 Advanced Filters"):
-        cities = ["All"] + sorted(filtered_clean_all["city"].dropna().unique().tolist())
-        selected_city = st.selectbox("🌆 Select City", cities, index=0)
-        min_count = st.slider("📊 Minimum Records per Combination", 1, 100, 10, step=5)
+@st.cache_data(show_spinner=False)
+def column_options(signature: tuple, col: str) -> list:
+    return load_filtered("clean_all", signature)[col].dropna().unique().tolist()
+
 
-    # Apply filters
-    df_para = filtered_clean_all.copy()
+# Figures are built in cached functions keyed by the filter signature and the
+# chart's own controls, and returned as JSON so reruns skip figure construction
+@st.cache_data(show_spinner=False)
+def build_parallel_categories(
+    signature: tuple, selected_city: str, min_count: int
+) -> str:
+    df_para = load_filtered("clean_all", signature)
     if selected_city != "All":
         df_para = df_para[df_para["city"] == selected_city]
 
-    # Count occurrences per combination
-    combo_counts = (
-        df_para.groupby(["campaign_id", "promo_type", "category"], as_index=False)
-        .size()
-        .rename(columns={"size": "count"})
+    # Collapse to one row per combination with its record count and mean margin,
+    # so each ribbon is sized by count instead of being drawn once per record
+    para_dimensions = ["campaign_id", "promo_type", "category"]
+    df_para = df_para.assign(
+        count=1, _margin_count=df_para["incremental_margin%"].notna()
     )
-
-    # Merge count back to main data
-    df_para = pd.merge(
-        df_para, combo_counts, on=["campaign_id", "promo_type", "category"], how="left"
+    df_para = grouped_sum(
+        df_para, para_dimensions, ["count", "incremental_margin%", "_margin_count"]
     )
+    df_para["incremental_margin%"] /= df_para.pop("_margin_count")
 
     # Apply threshold
     df_para = df_para[df_para["count"] >= min_count]
@@ -68,7 +79,7 @@ if (
     # Build Plotly Parallel Categories chart
     fig_para = px.parallel_categories(
         df_para,
-        dimensions=["campaign_id", "promo_type", "category"],
+        dimensions=para_dimensions,
         color="incremental_margin%",
         color_continuous_scale="RdYlGn",
         labels={
@@ -80,19 +91,56 @@ if (
         title="Parallel Categories — Campaign → Promo Type → Category",
     )
 
+    fig_para.update_traces(counts=df_para["count"].to_numpy(dtype=int))
+
     # Layout tuning
     fig_para.update_layout(
         height=600,
         margin=dict(t=60, l=20, r=20, b=20),
         template="plotly_white",
+        uirevision="parallel_categories",
     )
 
-    st.plotly_chart(fig_para, use_container_width=True)
+    return fig_para.to_json()
+
+
+# Each chart section is a fragment, so its own widgets only rerun that section
+@st.fragment
+def render_parallel_categories():
+    # Check required columns
+    required_cols = [
+        "campaign_id",
+        "promo_type",
+        "category",
+        "incremental_margin%",
+        "city",
+    ]
+    if (
+        set(required_cols).issubset(filtered_clean_all.columns)
+        and not filtered_clean_all.empty
+    ):
+
+        # Optional filters
+        with st.expander("🔍 Advanced Filters"):
+            cities = ["All"] + sorted(column_options(filter_signature, "city"))
+            selected_city = st.selectbox("🌆 Select City", cities, index=0)
+            min_count = st.slider(
+                "📊 Minimum Records per Combination", 1, 100, 10, step=5
+            )
+
+        # Apply filters and build the chart (cached per filter signature and controls)
+        fig_para = pio.from_json(
+            build_parallel_categories(filter_signature, selected_city, min_count)
+        )
+        st.plotly_chart(fig_para, use_container_width=True)
+
+    else:
+        st.warning(
+            "⚠️ Missing columns: Please ensure 'campaign_id', 'promo_type', 'category', 'incremental_margin%', and 'city' exist in clean_all."
+        )
 
-else:
-    st.warning(
-        "⚠️ Missing columns: Please ensure 'campaign_id', 'promo_type', 'category', 'incremental_margin%', and 'city' exist in clean_all."
-    )
+
+render_parallel_categories()
 
 st.caption(
     """
@@ -113,25 +161,12 @@ This helps quickly see **which offers worked best** and **which didn’t**.
 )
 
 
-st.subheader("Violin Plot: Incremental Margin % by Promo Type")
-
-required_cols = {"promo_type", "incremental_margin%"}
-if not required_cols.issubset(filtered_clean_all.columns):
-    st.warning(f"Missing columns: {required_cols - set(filtered_clean_all.columns)}")
-else:
-    # Optional: Filter by selected promo types
-    promo_options = filtered_clean_all["promo_type"].dropna().unique().tolist()
-    selected_promos = st.multiselect(
-        "Select Promo Types", options=promo_options, default=promo_options
-    )
-
-    df_plot = filtered_clean_all[filtered_clean_all["promo_type"].isin(selected_promos)]
-
-    # Choose metric to plot: incremental_margin%
-    metric = st.radio("Select Metric", ["incremental_margin%"], horizontal=True)
-
-    # Toggle to show points (beeswarm)
-    show_points = st.checkbox("Show individual points", value=True)
+@st.cache_data(show_spinner=False)
+def build_violin(
+    signature: tuple, selected_promos: tuple, metric: str, show_points: bool
+) -> str:
+    df_plot = load_filtered("clean_all", signature)
+    df_plot = df_plot[df_plot["promo_type"].isin(selected_promos)]
 
     fig_violin = px.violin(
         df_plot,
@@ -151,9 +186,42 @@ else:
         showlegend=False,
         template="plotly_white",
         height=500,
+        uirevision="violin",
     )
 
-    st.plotly_chart(fig_violin, use_container_width=True)
+    return fig_violin.to_json()
+
+
+@st.fragment
+def render_violin():
+    st.subheader("Violin Plot: Incremental Margin % by Promo Type")
+
+    required_cols = {"promo_type", "incremental_margin%"}
+    if not required_cols.issubset(filtered_clean_all.columns):
+        st.warning(
+            f"Missing columns: {required_cols - set(filtered_clean_all.columns)}"
+        )
+    else:
+        # Optional: Filter by selected promo types
+        promo_options = column_options(filter_signature, "promo_type")
+        selected_promos = st.multiselect(
+            "Select Promo Types", options=promo_options, default=promo_options
+        )
+
+        # Choose metric to plot: incremental_margin%
+        metric = st.radio("Select Metric", ["incremental_margin%"], horizontal=True)
+
+        # Toggle to show points (beeswarm)
+        show_points = st.checkbox("Show individual points", value=True)
+
+        fig_violin = pio.from_json(
+            build_violin(filter_signature, tuple(selected_promos), metric, show_points)
+        )
+
+        st.plotly_chart(fig_violin, use_container_width=True)
+
+
+render_violin()
 
 st.caption(
     """
@@ -171,34 +239,11 @@ It helps see **which promo types perform better** and **which tend to lose profi
 )
 
 
-st.subheader("Sankey: Campaign → Promo Type → Category → Revenue/Units")
-
-# Ensure required columns exist
-required_cols = {
-    "campaign_id",
-    "promo_type",
-    "category",
-    "revenue_after_promo",
-    "total_quantity_sold",
-}
-if not required_cols.issubset(filtered_clean_all.columns):
-    st.warning(f"Missing columns: {required_cols - set(filtered_clean_all.columns)}")
-else:
-    df_sankey = filtered_clean_all.copy()
-
-    # Metric selection: Revenue or Units
-    metric = st.radio("Select Metric", ["Revenue", "Units"], horizontal=True)
+@st.cache_data(show_spinner=False)
+def build_sankey(signature: tuple, metric: str, min_value: int) -> str:
+    df_sankey = load_filtered("clean_all", signature)
     value_col = "revenue_after_promo" if metric == "Revenue" else "total_quantity_sold"
 
-    # Min threshold slider
-    min_value = st.slider(
-        f"Minimum {metric} to display",
-        min_value=0,
-        max_value=int(df_sankey[value_col].max()),
-        value=0,
-        step=100,
-    )
-
     # Filter rows by threshold
     df_sankey = df_sankey[df_sankey[value_col] >= min_value]
 
@@ -207,28 +252,33 @@ else:
     promos = df_sankey["promo_type"].unique().tolist()
     categories = df_sankey["category"].unique().tolist()
     labels = campaigns + promos + categories
-    label_indices = {label: i for i, label in enumerate(labels)}
+    offsets = {
+        "campaign_id": (campaigns, 0),
+        "promo_type": (promos, len(campaigns)),
+        "category": (categories, len(campaigns) + len(promos)),
+    }
+
+    def node_index(links: pd.DataFrame, col: str) -> np.ndarray:
+        level, offset = offsets[col]
+        codes = pd.Categorical(links[col], categories=level).codes
+        return codes.astype(np.int64) + offset
 
     # Build links: Campaign -> Promo Type
-    df_links1 = (
-        df_sankey.groupby(["campaign_id", "promo_type"])[value_col].sum().reset_index()
-    )
-    source1 = df_links1["campaign_id"].map(label_indices)
-    target1 = df_links1["promo_type"].map(label_indices)
-    value1 = df_links1[value_col]
+    df_links1 = grouped_sum(df_sankey, ["campaign_id", "promo_type"], [value_col])
+    source1 = node_index(df_links1, "campaign_id")
+    target1 = node_index(df_links1, "promo_type")
+    value1 = df_links1[value_col].to_numpy()
 
     # Build links: Promo Type -> Category
-    df_links2 = (
-        df_sankey.groupby(["promo_type", "category"])[value_col].sum().reset_index()
-    )
-    source2 = df_links2["promo_type"].map(label_indices)
-    target2 = df_links2["category"].map(label_indices)
-    value2 = df_links2[value_col]
+    df_links2 = grouped_sum(df_sankey, ["promo_type", "category"], [value_col])
+    source2 = node_index(df_links2, "promo_type")
+    target2 = node_index(df_links2, "category")
+    value2 = df_links2[value_col].to_numpy()
 
     # Combine
-    sources = pd.concat([source1, source2], ignore_index=True)
-    targets = pd.concat([target1, target2], ignore_index=True)
-    values = pd.concat([value1, value2], ignore_index=True)
+    sources = np.concatenate([source1, source2])
+    targets = np.concatenate([target1, target2])
+    values = np.concatenate([value1, value2])
 
     # Sankey diagram
     fig_sankey = go.Figure(
@@ -248,9 +298,50 @@ else:
         title_text=f"Sankey Flow: Campaign → Promo Type → Category ({metric})",
         font_size=12,
         height=600,
+        uirevision="sankey",
     )
 
-    st.plotly_chart(fig_sankey, use_container_width=True)
+    return fig_sankey.to_json()
+
+
+@st.fragment
+def render_sankey():
+    st.subheader("Sankey: Campaign → Promo Type → Category → Revenue/Units")
+
+    # Ensure required columns exist
+    required_cols = {
+        "campaign_id",
+        "promo_type",
+        "category",
+        "revenue_after_promo",
+        "total_quantity_sold",
+    }
+    if not required_cols.issubset(filtered_clean_all.columns):
+        st.warning(
+            f"Missing columns: {required_cols - set(filtered_clean_all.columns)}"
+        )
+    else:
+        # Metric selection: Revenue or Units
+        metric = st.radio("Select Metric", ["Revenue", "Units"], horizontal=True)
+        value_col = (
+            "revenue_after_promo" if metric == "Revenue" else "total_quantity_sold"
+        )
+
+        # Min threshold slider
+        min_value = st.slider(
+            f"Minimum {metric} to display",
+            min_value=0,
+            max_value=column_max(filter_signature, value_col),
+            value=0,
+            step=100,
+        )
+
+        fig_sankey = pio.from_json(build_sankey(filter_signature, metric, min_value))
+
+        st.plotly_chart(fig_sankey, use_container_width=True)
+
+
+render_sankey()
 
 st.caption(
     """
@@ -268,28 +359,12 @@ which generated high revenue from **Grocery & Staples** and **Home Appliances**.
 """
 )
 
-st.subheader("Faceted Small Multiples: Before/After KPI per Campaign")
-
-# KPI toggle: Revenue or Units
-kpi_option = st.radio("Select KPI", ["Revenue", "Units"], horizontal=True)
-
-# Map KPI to column names
-if kpi_option == "Revenue":
-    before_col = "revenue_before_promo"
-    after_col = "revenue_after_promo"
-    y_label = "Revenue (₹)"
-else:
-    before_col = "quantity_sold (before_promo)"
-    after_col = "quantity_sold (after_promo)"
-    y_label = "Units Sold"
-
-# Ensure columns exist
-required_cols = {"campaign_id", "product_name", before_col, after_col}
-missing_cols = required_cols - set(filtered_clean_all.columns)
-if missing_cols:
-    st.warning(f"Missing columns: {missing_cols}")
-else:
-    df_facet = filtered_clean_all.copy()
+
+@st.cache_data(show_spinner=False)
+def build_facet(
+    signature: tuple, kpi_option: str, before_col: str, after_col: str, y_label: str
+) -> str:
+    df_facet = load_filtered("clean_all", signature)
 
     # Melt KPI for Before/After
     df_melt = df_facet.melt(
@@ -322,37 +397,56 @@ else:
         title=f"Before vs After {kpi_option} per Campaign",
         legend=dict(y=1.1, orientation="h"),
         margin=dict(t=80, b=50),
+        uirevision="facet",
     )
 
-    st.plotly_chart(fig_facet, use_container_width=True)
-
-st.subheader("Sunburst — Hierarchical Promo Insights")
-
-# Required columns
-required_cols = {
-    "campaign_id",
-    "promo_type",
-    "category",
-    "product_name",
-    "incremental_margin%",
-    "revenue_after_promo",
-    "total_quantity_sold",
-}
-missing = required_cols - set(filtered_clean_all.columns)
-if missing:
-    st.warning(
-        f"Sunburst requires these columns in filtered_clean_all: {sorted(missing)}"
-    )
-else:
-    df_sb = filtered_clean_all.copy()
+    return fig_facet.to_json()
+
+
+@st.fragment
+def render_facet():
+    st.subheader("Faceted Small Multiples: Before/After KPI per Campaign")
+
+    # KPI toggle: Revenue or Units
+    kpi_option = st.radio("Select KPI", ["Revenue", "Units"], horizontal=True)
+
+    # Map KPI to column names
+    if kpi_option == "Revenue":
+        before_col = "revenue_before_promo"
+        after_col = "revenue_after_promo"
+        y_label = "Revenue (₹)"
+    else:
+        before_col = "quantity_sold (before_promo)"
+        after_col = "quantity_sold (after_promo)"
+        y_label = "Units Sold"
+
+    # Ensure columns exist
+    required_cols = {"campaign_id", "product_name", before_col, after_col}
+    missing_cols = required_cols - set(filtered_clean_all.columns)
+    if missing_cols:
+        st.warning(f"Missing columns: {missing_cols}")
+    else:
+        fig_facet = pio.from_json(
+            build_facet(filter_signature, kpi_option, before_col, after_col, y_label)
+        )
+
+        st.plotly_chart(fig_facet, use_container_width=True)
+
+
+render_facet()
+
+
+@st.cache_data(show_spinner=False)
+def build_sunburst(
+    signature: tuple, focus_city: str | None, kpi_focus: str, top_n: int
+) -> str:
+    df_sb = load_filtered("clean_all", signature)
 
     # Optional: city filter (matches how you scope other visuals)
-    focus_city = st.session_state.get("selected_city", "All")
     if focus_city and focus_city != "All" and "city" in df_sb.columns:
         df_sb = df_sb[df_sb["city"] == focus_city]
 
-    # KPI selection (uses session_state main KPI if present)
-    kpi_focus = st.session_state.get("kpi_focus", "Revenue")
+    # KPI selection
     if kpi_focus == "Revenue":
         value_col = "revenue_after_promo"
         value_label = "Revenue (₹)"
@@ -360,29 +454,29 @@ else:
         value_col = "total_quantity_sold"
         value_label = "Units"
 
-    # Optional control: limit to top N leaf combinations to avoid clutter
-    top_n = st.number_input(
-        "Limit to top N leaf combinations (0 = no limit)",
-        min_value=0,
-        max_value=500,
-        value=0,
-        step=10,
-    )
-
     # Aggregate by hierarchy path
     path = ["campaign_id", "promo_type", "category", "product_name"]
-    agg = df_sb.groupby(path, as_index=False).agg(
-        **{value_col: (value_col, "sum")},
-        incremental_margin_pct=("incremental_margin%", "mean"),
+    # Revenue-weighted margin: two plain sums instead of a mean of ratios
+    df_sb = df_sb.assign(
+        _m_times_r=df_sb["incremental_margin%"] * df_sb["revenue_after_promo"]
     )
+    sum_cols = list(dict.fromkeys([value_col, "_m_times_r", "revenue_after_promo"]))
+    agg = grouped_sum(df_sb, path, sum_cols)
+    agg["incremental_margin_pct"] = agg.pop("_m_times_r") / agg["revenue_after_promo"]
 
     # Optional: prune to top-N leaf nodes by value (keeps highest contributors)
     if top_n and top_n > 0:
         top_leaves = (
-            agg.groupby("product_name")[value_col].sum().nlargest(top_n).index.tolist()
+            agg.groupby("product_name", observed=True)[value_col]
+            .sum()
+            .nlargest(top_n)
+            .index.tolist()
         )
         agg = agg[agg["product_name"].isin(top_leaves)]
 
+    # px hierarchies group without observed=True, so hand them plain labels
+    agg = agg.astype({col: str for col in path})
+
     # Build sunburst
     fig_sb = px.sunburst(
         agg,
@@ -401,10 +495,54 @@ else:
         height=700,
         template="plotly_white",
         coloraxis_colorbar=dict(title="Incremental Margin %"),
+        uirevision="sunburst",
     )
 
-    # show chart with unique key
-    st.plotly_chart(fig_sb, use_container_width=True, key="sunburst_chart")
+    return fig_sb.to_json()
+
+
+@st.fragment
+def render_sunburst():
+    st.subheader("Sunburst — Hierarchical Promo Insights")
+
+    # Required columns
+    required_cols = {
+        "campaign_id",
+        "promo_type",
+        "category",
+        "product_name",
+        "incremental_margin%",
+        "revenue_after_promo",
+        "total_quantity_sold",
+    }
+    missing = required_cols - set(filtered_clean_all.columns)
+    if missing:
+        st.warning(
+            f"Sunburst requires these columns in filtered_clean_all: {sorted(missing)}"
+        )
+    else:
+        # City focus and main KPI come from session_state (matches other visuals)
+        focus_city = st.session_state.get("selected_city", "All")
+        kpi_focus = st.session_state.get("kpi_focus", "Revenue")
+
+        # Optional control: limit to top N leaf combinations to avoid clutter
+        top_n = st.number_input(
+            "Limit to top N leaf combinations (0 = no limit)",
+            min_value=0,
+            max_value=500,
+            value=0,
+            step=10,
+        )
+
+        fig_sb = pio.from_json(
+            build_sunburst(filter_signature, focus_city, kpi_focus, top_n)
+        )
+
+        # show chart with unique key
+        st.plotly_chart(fig_sb, use_container_width=True, key="sunburst_chart")
+
+
+render_sunburst()
 
 st.caption(
     """
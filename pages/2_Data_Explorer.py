@@ -1,7 +1,7 @@
 from __future__ import annotations
 import streamlit as st
 import pandas as pd
-from scripts.data_loader import get_all_datasets
+from scripts.data_loader import CSV_ALIASES, get_all_datasets, load_csv
 from scripts.ui_utils import init_session_state, dataframe_download
 
 st.set_page_config(page_title="Data Explorer", layout="wide")
@@ -11,12 +11,27 @@ datasets = get_all_datasets()
 
 st.markdown("## 🧭 Data Explorer")
 
-alias = st.selectbox("Dataset", list(datasets.keys()))
-df = datasets.get(alias, pd.DataFrame())
+alias = st.selectbox("Dataset", list(CSV_ALIASES))
+# Datasets too large for get_all_datasets are only loaded once picked here
+df = datasets[alias] if alias in datasets else load_csv(alias)
 
 if df is None or df.empty:
     st.info("No data loaded for selected dataset.")
 else:
-    st.dataframe(df, use_container_width=True)
-    dataframe_download(df, f"{alias}.csv")
+    # Only send the visible page of rows to the browser
+    rows_col, offset_col = st.columns(2)
+    with rows_col:
+        rows = st.number_input(
+            "Rows", min_value=100, max_value=100_000, value=1_000, step=100
+        )
+    with offset_col:
+        offset = st.number_input(
+            "Offset", min_value=0, max_value=max(len(df) - 1, 0), value=0, step=rows
+        )
+    st.dataframe(df.iloc[offset : offset + rows], use_container_width=True)
+    st.caption(
+        f"Showing rows {offset + 1:,}–{min(offset + rows, len(df)):,} of {len(df):,}"
+    )
+    # Explorer datasets are unfiltered, so the alias identifies the export
+    dataframe_download(df, f"{alias}.csv", key=alias)
 st.caption("Tip: Place your CSVs under /data named as per aliases in scripts/data_loader.py")
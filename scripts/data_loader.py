@@ -1,9 +1,18 @@
 from __future__ import annotations
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from typing import Dict, Optional
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
 DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.getcwd(), "data"))
 
@@ -17,6 +26,19 @@ CSV_ALIASES = {
     "clean_all": "clean_all.csv",
 }
 
+# Parquet mirrors written next to each CSV on first load
+PARQUET_ALIASES = {
+    alias: os.path.splitext(filename)[0] + ".parquet"
+    for alias, filename in CSV_ALIASES.items()
+}
+
+# Mirrors larger than this are scanned with the global filters pushed down
+# instead of being loaded whole and filtered in memory
+LAZY_SCAN_BYTES = 50 * 1024 * 1024
+
+# Rows per chunk when a large CSV without a mirror is filtered while streaming
+CHUNK_ROWS = 200_000
+
 EXPECTED_SCHEMAS: Dict[str, list[str]] = {
     "campaign_data": ["campaign_id", "campaign_name", "start_date", "end_date"],
     "product_data": ["product_code", "product_name", "category"],
@@ -91,56 +113,531 @@ EXPECTED_SCHEMAS: Dict[str, list[str]] = {
     ],
 }
 
+# Low-cardinality columns used for filtering and grouping across the pages
+CATEGORICAL_COLUMNS = (
+    "campaign_id",
+    "category",
+    "product_name",
+    "promo_type",
+    "city",
+    "product_code",
+)
+
+# Per-alias dtypes passed to read_csv so filter columns skip type inference;
+# numeric columns keep the parser's inferred dtypes
+DTYPES: Dict[str, Dict[str, str]] = {
+    alias: {col: "category" for col in schema if col in CATEGORICAL_COLUMNS}
+    for alias, schema in EXPECTED_SCHEMAS.items()
+}
+
+# Common alternative column names -> harmonized name (read-only)
+COLUMN_RENAMES = MappingProxyType({
+    "quantity_sold(before_promo)": "quantity_sold (before_promo)",
+    "quantity_sold(after_promo)": "quantity_sold (after_promo)",
+    "Incremental Revenue": "incremental_revenue",
+    "IR%": "ir%",
+    "ISU%": "isu%",
+    "incremental_margin %": "incremental_margin%",
+})
+
+# Map of dataframe column -> corresponding session_state key
+FILTER_MAP = {
+    "campaign_id": "campaigns",
+    "category": "categories",
+    "product_name": "products",
+    "promo_type": "promo_types",
+    "city": "cities",
+}
+
+# session_state keys of the campaign date range filter
+DATE_KEYS = ("date_start", "date_end")
+
+# Per-alias integer columns stored as int32 when their values fit. Nothing
+# goes below int32: prices and quantities are multiplied on the pages, and an
+# int16 product such as 200 * 200 would silently wrap
+_DOWNCAST_COLS: Dict[str, tuple[str, ...]] = {
+    "event_data": (
+        "base_price",
+        "quantity_sold (before_promo)",
+        "quantity_sold (after_promo)",
+    ),
+    "clean_revenue": (
+        "base_price",
+        "quantity_sold (before_promo)",
+        "quantity_sold (after_promo)",
+        "total_quantity_sold",
+        "revenue_before_promo",
+    ),
+    "city_sales": (
+        "total_quantity_sold",
+        "quantity_before_promo",
+        "quantity_after_promo",
+    ),
+    "clean_all": (
+        "base_price",
+        "quantity_sold (before_promo)",
+        "quantity_sold (after_promo)",
+        "total_quantity_sold",
+        "revenue_before_promo",
+    ),
+}
+
+
+# Stats of the files in DATA_DIR from one os.scandir pass, plus which aliases
+# are above LAZY_SCAN_BYTES. Built lazily and dropped by _invalidate_dir_index
+# on every loader cache miss (so CSVs edited or added since are seen) and
+# whenever a mirror is written or removed
+_DIR_INDEX: Optional[tuple[Dict[str, os.stat_result], Dict[str, bool]]] = None
+_DIR_INDEX_LOCK = threading.Lock()
+
+
+def _fresh_in(stats: Dict[str, os.stat_result], alias: str) -> bool:
+    """Whether ``stats`` holds a mirror of ``alias`` not older than its CSV."""
+    csv_stat = stats.get(CSV_ALIASES[alias])
+    parquet_stat = stats.get(PARQUET_ALIASES[alias])
+    return (
+        csv_stat is not None
+        and parquet_stat is not None
+        and parquet_stat.st_mtime >= csv_stat.st_mtime
+    )
+
+
+def _scan_data_dir() -> tuple[Dict[str, os.stat_result], Dict[str, bool]]:
+    """Stat every file of DATA_DIR in one pass and size up each alias."""
+    stats = {}
+    try:
+        with os.scandir(DATA_DIR) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stats[entry.name] = entry.stat()
+                except OSError:
+                    # Removed between the listing and the stat
+                    continue
+    except OSError:
+        # A missing DATA_DIR reports every file as missing
+        pass
+    large = {}
+    for alias in CSV_ALIASES:
+        # Size of the file a load reads: the fresh mirror, else the CSV
+        source = stats.get(
+            PARQUET_ALIASES[alias] if _fresh_in(stats, alias) else CSV_ALIASES[alias]
+        )
+        large[alias] = source is not None and source.st_size > LAZY_SCAN_BYTES
+    return stats, large
+
+
+def _dir_index() -> tuple[Dict[str, os.stat_result], Dict[str, bool]]:
+    """The current directory index, scanning DATA_DIR if it was invalidated."""
+    global _DIR_INDEX
+    with _DIR_INDEX_LOCK:
+        if _DIR_INDEX is None:
+            _DIR_INDEX = _scan_data_dir()
+        return _DIR_INDEX
+
+
+def _invalidate_dir_index() -> None:
+    global _DIR_INDEX
+    with _DIR_INDEX_LOCK:
+        _DIR_INDEX = None
+
+
+def _stat(filename: str) -> Optional[os.stat_result]:
+    """Indexed stat of ``filename`` under DATA_DIR, or None when it is absent."""
+    return _dir_index()[0].get(filename)
+
+
+def _mirror_is_fresh(alias: str) -> bool:
+    """Whether the Parquet mirror of ``alias`` exists and is not older than its CSV."""
+    return _fresh_in(_dir_index()[0], alias)
+
+
+def _csv_read_options(
+    alias: str,
+    path: str,
+    dtype: Optional[Dict[str, str]],
+    columns: Optional[list[str]] = None,
+) -> dict:
+    """read_csv keyword arguments restricting the parse to the declared schema.
+
+    ``columns`` (harmonized names) narrows the parse further to those columns.
+    """
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    schema = set(EXPECTED_SCHEMAS.get(alias, []))
+    usecols = [
+        c
+        for c in header
+        if c.strip() in schema or COLUMN_RENAMES.get(c.strip()) in schema
+    ]
+    if not usecols:
+        usecols = header
+    if columns is not None:
+        wanted = set(columns)
+        usecols = [
+            c for c in usecols if COLUMN_RENAMES.get(c.strip(), c.strip()) in wanted
+        ]
+    dtypes = {**DTYPES.get(alias, {}), **(dtype or {})}
+    return {
+        "usecols": usecols,
+        "dtype": {c: t for c, t in dtypes.items() if c in usecols},
+    }
+
+
+def _read_csv(
+    alias: str,
+    path: str,
+    dtype: Optional[Dict[str, str]],
+    columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """Parse ``path`` with the multithreaded Arrow reader (C parser as fallback)."""
+    options = _csv_read_options(alias, path, dtype, columns)
+    try:
+        return pd.read_csv(path, engine="pyarrow", **options)
+    except ValueError:
+        # Arrow rejects some malformed files the C parser tolerates
+        return pd.read_csv(path, engine="c", **options)
+
+
+def _harmonize(df: pd.DataFrame, alias: str) -> pd.DataFrame:
+    """Parse dates, normalize column names and categorize the filter columns."""
+    # Parse date columns if present (dd-mm-yyyy in the campaign CSV); Parquet
+    # mirrors already hold datetime64 columns
+    for col in ("start_date", "end_date"):
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(
+                df[col], errors="coerce", dayfirst=True, cache=True
+            )
+
+    # Normalize column names to strip whitespace variants
+    df.columns = [c.strip() for c in df.columns]
+
+    # Attempt to harmonize common alternative column names in one pass,
+    # probing only the aliases actually present
+    columns = set(df.columns)
+    renames = {
+        k: COLUMN_RENAMES[k]
+        for k in columns & COLUMN_RENAMES.keys()
+        if COLUMN_RENAMES[k] not in columns
+    }
+    if renames:
+        df.rename(columns=renames, inplace=True)
+
+    # Shrink the declared integer columns to int32 when their values fit.
+    # Sums still upcast to int64; floats stay float64 so revenue totals and the
+    # ratio columns keep full precision
+    int32 = np.iinfo(np.int32)
+    for col in _DOWNCAST_COLS.get(alias, ()):
+        if col in df.columns and df[col].dtype.kind in "iu":
+            values = df[col]
+            fits = values.empty or (
+                values.min() >= int32.min and values.max() <= int32.max
+            )
+            if fits:
+                df[col] = values.astype(np.int32)
+
+    return to_categorical(df)
+
+
+def _missing_columns(alias: str, columns: pd.Index) -> list[str]:
+    """Columns of EXPECTED_SCHEMAS[alias] (harmonized names) absent from ``columns``."""
+    present = set(columns)
+    expected = (COLUMN_RENAMES.get(c, c) for c in EXPECTED_SCHEMAS.get(alias, []))
+    return [c for c in expected if c not in present]
+
+
+def _write_mirror(df: pd.DataFrame, parquet_path: str) -> None:
+    """Write ``df`` to ``parquet_path`` atomically through a temp file in DATA_DIR.
+
+    A reader never sees a partial mirror, and an interrupted write leaves
+    the previous mirror (or none) in place.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=DATA_DIR, prefix=f".{os.path.basename(parquet_path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            df.to_parquet(f, index=False, compression="snappy")
+        os.replace(tmp_path, parquet_path)
+        _invalidate_dir_index()
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
 
 @st.cache_data(show_spinner=False)
-def load_csv(alias: str, dtype: Optional[Dict[str, str]] = None) -> pd.DataFrame:
-    """Load CSV by alias from DATA_DIR with caching and light validation."""
+def _load_dataset(
+    alias: str,
+    dtype: Optional[Dict[str, str]] = None,
+    columns: Optional[list[str]] = None,
+) -> tuple[pd.DataFrame, list[tuple[str, str]]]:
+    """Cached body of ``load_csv``, returning the frame and its load problems.
+
+    Problems come back as ``(level, message)`` pairs instead of being shown,
+    so cached callers (``load_filtered`` and the page builders) stay silent
+    rather than replaying the warnings once per level of nesting.
+    """
     if alias not in CSV_ALIASES:
         raise KeyError(f"Unknown dataset alias: {alias}")
+    _invalidate_dir_index()
+    problems = []
     filename = CSV_ALIASES[alias]
     path = os.path.join(DATA_DIR, filename)
-    if not os.path.exists(path):
-        st.warning(f"Missing data file: {filename} under {DATA_DIR}")
-        return pd.DataFrame()
-    try:
-        df = pd.read_csv(path, dtype=dtype  )
-    except Exception as exc:
-        st.error(f"Failed reading {filename}: {exc}")
+    if _stat(filename) is None:
+        problems.append(
+            ("warning", f"Missing data file: {filename} under {DATA_DIR}")
+        )
+        return pd.DataFrame(), problems
+    # Prefer the Parquet mirror written on a previous load unless the CSV is newer
+    parquet_path = os.path.join(DATA_DIR, PARQUET_ALIASES[alias])
+    use_parquet = dtype is None and _mirror_is_fresh(alias)
+    if use_parquet:
+        try:
+            projection = columns
+            if columns is not None:
+                names = pq.read_schema(parquet_path).names
+                projection = [c for c in columns if c in names]
+            df = pd.read_parquet(parquet_path, columns=projection)
+        except (OSError, pa.ArrowException, ValueError):
+            # Truncated or corrupt mirror: read the CSV and rewrite it below
+            use_parquet = False
+    if not use_parquet:
+        try:
+            df = _read_csv(alias, path, dtype, columns)
+        except Exception as exc:
+            problems.append(("error", f"Failed reading {filename}: {exc}"))
+            return pd.DataFrame(), problems
+
+    df = _harmonize(df, alias)
+    if columns is None:
+        missing = _missing_columns(alias, df.columns)
+        if missing:
+            problems.append(
+                ("warning", f"{filename} is missing expected columns: {missing}")
+            )
+    # Only full reads are mirrored; a projected read parsed just ``columns``
+    if not use_parquet and dtype is None and columns is None:
+        try:
+            _write_mirror(df, parquet_path)
+        except (OSError, TypeError, ValueError):
+            # Read-only data dir or unsupported column types: the CSV stays the source
+            pass
+    if columns is not None and not use_parquet:
+        df = df[[c for c in columns if c in df.columns]]
+    return df, problems
+
+
+def load_csv(
+    alias: str,
+    dtype: Optional[Dict[str, str]] = None,
+    columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """Load CSV by alias from DATA_DIR with caching and light validation.
+
+    Reads the Parquet mirror instead when it is up to date; ``columns``
+    limits the result (and the Parquet or CSV parse) to the given columns.
+    """
+    df, problems = _load_dataset(alias, dtype, columns)
+    for level, message in problems:
+        (st.error if level == "error" else st.warning)(message)
+    return df
+
+
+def load_lazy(alias: str) -> Optional[ds.Dataset]:
+    """Open the Parquet mirror of ``alias`` for a filtered scan, if it is fresh."""
+    if alias not in CSV_ALIASES:
+        raise KeyError(f"Unknown dataset alias: {alias}")
+    if not _mirror_is_fresh(alias):
+        return None
+    return ds.dataset(os.path.join(DATA_DIR, PARQUET_ALIASES[alias]), format="parquet")
+
+
+def filter_expression(state: dict, columns: list[str]) -> Optional[ds.Expression]:
+    """Arrow predicate equivalent to ``apply_global_filters`` for a dataset scan."""
+    expr = None
+    for col, key in FILTER_MAP.items():
+        selected_values = state.get(key, [])
+        if col in columns and selected_values:
+            predicate = ds.field(col).isin(list(selected_values))
+            expr = predicate if expr is None else expr & predicate
+    start, end = (state.get(key) for key in DATE_KEYS)
+    if start is not None and end is not None and {"start_date", "end_date"}.issubset(
+        columns
+    ):
+        predicate = (ds.field("start_date") <= pa.scalar(pd.Timestamp(end))) & (
+            ds.field("end_date") >= pa.scalar(pd.Timestamp(start))
+        )
+        expr = predicate if expr is None else expr & predicate
+    return expr
+
+
+def load_csv_filtered(alias: str, state: dict) -> pd.DataFrame:
+    """Read ``alias`` in chunks of CHUNK_ROWS, keeping only rows passing the filters."""
+    if alias not in CSV_ALIASES:
+        raise KeyError(f"Unknown dataset alias: {alias}")
+    path = os.path.join(DATA_DIR, CSV_ALIASES[alias])
+    reader = pd.read_csv(
+        path, chunksize=CHUNK_ROWS, engine="c", **_csv_read_options(alias, path, None)
+    )
+    parts = []
+    with reader:
+        for chunk in reader:
+            part = apply_global_filters(_harmonize(chunk, alias), state)
+            # Keep the first chunk even when empty so the columns survive
+            if part.empty and parts:
+                continue
+            parts.append(part)
+    if not parts:
         return pd.DataFrame()
+    # Chunks carry their own categories; re-categorize over the union
+    return to_categorical(pd.concat(parts))
 
-    # Parse date columns if present
-    for col in ("start_date", "end_date"):
+
+def is_large(alias: str) -> bool:
+    """Whether ``alias`` is above LAZY_SCAN_BYTES and so only read filtered."""
+    return _dir_index()[1][alias]
+
+
+# Shared by every session and rerun instead of a pool per get_all_datasets call
+_LOAD_POOL = ThreadPoolExecutor(max_workers=len(CSV_ALIASES))
+
+
+def get_all_datasets() -> Dict[str, pd.DataFrame]:
+    """Every dataset loaded whole, except those above LAZY_SCAN_BYTES.
+
+    Large datasets are left out so they are only ever materialized through
+    ``load_filtered`` (a pushed-down scan or a chunked CSV read) or through
+    ``load_csv`` with a column projection.
+    """
+    # Load the files concurrently; parsing and disk reads release the GIL
+    ctx = get_script_run_ctx()
+
+    def load(alias: str) -> pd.DataFrame:
+        # Worker threads need the script context for caching and st.warning
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return load_csv(alias)
+
+    aliases = [alias for alias in CSV_ALIASES if not is_large(alias)]
+    return dict(zip(aliases, _LOAD_POOL.map(load, aliases)))
+
+
+def convert_to_parquet() -> None:
+    """Rebuild every Parquet mirror from its CSV."""
+    _load_dataset.clear()
+    _invalidate_dir_index()
+    for filename in PARQUET_ALIASES.values():
+        if _stat(filename) is not None:
+            os.remove(os.path.join(DATA_DIR, filename))
+    _invalidate_dir_index()
+    for alias in PARQUET_ALIASES:
+        load_csv(alias)
+
+
+def to_categorical(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the shared filter/grouping columns of ``df`` to category dtype."""
+    for col in CATEGORICAL_COLUMNS:
         if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
+            df[col] = df[col].astype("category")
+    return df
 
-    # Normalize column names to strip whitespace variants
-    df.columns = [c.strip() for c in df.columns]
 
-    # Attempt to harmonize common alternative column names
-    rename_map = {
-        "quantity_sold(before_promo)": "quantity_sold (before_promo)",
-        "quantity_sold(after_promo)": "quantity_sold (after_promo)",
-        "Incremental Revenue": "incremental_revenue",
-        "IR%": "ir%",
-        "ISU%": "isu%",
-        "incremental_margin %": "incremental_margin%",
+def grouped_sum(df: pd.DataFrame, keys: list[str], values: list[str]) -> pd.DataFrame:
+    """
+    Sum ``values`` per observed combination of ``keys``.
+
+    Each key is factorized to integer codes and the codes are combined into a
+    single flat group id, so every value column reduces with one
+    ``np.bincount`` instead of a pandas groupby. Rows with a missing key are
+    dropped and missing values are skipped, matching ``groupby(...).sum()``.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataframe to aggregate.
+    keys : list[str]
+        Grouping columns, in output sort order.
+    values : list[str]
+        Numeric columns to sum.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per observed key combination, sorted by ``keys``.
+    """
+    codes, uniques = [], []
+    for key in keys:
+        key_codes, key_uniques = pd.factorize(df[key], sort=True)
+        codes.append(key_codes)
+        uniques.append(key_uniques)
+
+    valid = np.logical_and.reduce([key_codes >= 0 for key_codes in codes])
+    if not valid.any():
+        return pd.DataFrame(columns=[*keys, *values])
+
+    shape = tuple(len(key_uniques) for key_uniques in uniques)
+    group_ids = np.ravel_multi_index([key_codes[valid] for key_codes in codes], shape)
+    groups, inverse = np.unique(group_ids, return_inverse=True)
+
+    out = {
+        key: key_uniques.take(key_codes)
+        for key, key_uniques, key_codes in zip(
+            keys, uniques, np.unravel_index(groups, shape)
+        )
     }
-    columns_lower = {c.lower(): c for c in df.columns}
-    for k, v in list(rename_map.items()):
-        if k in df.columns and v not in df.columns:
-            df.rename(columns={k: v}, inplace=True)
+    for col in values:
+        weights = df[col].to_numpy(dtype=float)[valid]
+        sums = np.bincount(inverse, weights=np.where(np.isnan(weights), 0.0, weights))
+        # bincount accumulates in float64; keep integer/bool counts integral
+        if df[col].dtype.kind in "biu":
+            sums = sums.round().astype(np.int64)
+        out[col] = sums
+    return pd.DataFrame(out)
 
-    return df
 
+def filter_key(state: dict) -> tuple:
+    """Hashable signature of the global filter selections held in ``state``."""
+    selections = tuple(
+        tuple(sorted(state.get(key) or [])) for key in FILTER_MAP.values()
+    )
+    return selections + tuple(state.get(key) for key in DATE_KEYS)
+
+
+@st.cache_data(show_spinner=False)
+def load_filtered(alias: str, key: tuple) -> pd.DataFrame:
+    """Globally filtered ``alias`` dataset, cached per filter signature."""
+    _invalidate_dir_index()
+    state = dict(zip([*FILTER_MAP.values(), *DATE_KEYS], key))
+    if is_large(alias):
+        dataset = load_lazy(alias)
+        if dataset is not None:
+            # Large mirror: push the filters into the file scan so row groups
+            # can be skipped and only the matching rows are materialized
+            expr = filter_expression(state, dataset.schema.names)
+            return dataset.to_table(filter=expr).to_pandas()
+        # Large CSV without a mirror: stream it instead of loading it whole
+        return load_csv_filtered(alias, state)
+    return apply_global_filters(_load_dataset(alias)[0], state)
 
-def get_all_datasets() -> Dict[str, pd.DataFrame]:
-    return {alias: load_csv(alias) for alias in CSV_ALIASES}
+
+@lru_cache(maxsize=256)
+def _category_lut(categories: tuple, selected: tuple) -> np.ndarray:
+    """Boolean lookup table over category codes marking the ``selected`` values.
+
+    The extra trailing ``False`` entry is what code ``-1`` (missing) indexes.
+    """
+    codes = pd.Index(categories).get_indexer(list(selected))
+    lut = np.zeros(len(categories) + 1, dtype=bool)
+    lut[codes[codes >= 0]] = True
+    lut.setflags(write=False)
+    return lut
 
 
 def apply_global_filters(df: pd.DataFrame, state: dict) -> pd.DataFrame:
     """
-    Apply global Streamlit filters (campaign, category, product, promo_type, city)
-    to a given dataframe.
+    Apply global Streamlit filters (campaign, category, product, promo_type, city,
+    campaign date range) to a given dataframe.
 
     Parameters
     ----------
@@ -158,42 +655,47 @@ def apply_global_filters(df: pd.DataFrame, state: dict) -> pd.DataFrame:
     if df is None or df.empty:
         return df
 
-    # Map of dataframe column -> corresponding session_state key
-    filter_map = {
-        "campaign_id": "campaigns",
-        "category": "categories",
-        "product_name": "products",
-        "promo_type": "promo_types",
-        "city": "cities",
-    }
-
-    filters = []
-    for col, key in filter_map.items():
-        # Use .get() to avoid KeyError if missing in session_state
-        selected_values = state.get(key, [])
-        if col in df.columns and selected_values:
-            filters.append(df[col].isin(selected_values))
-
-    # Combine all filters safely
-    if filters:
-        df = df[np.logical_and.reduce(filters)]
-
-    return df
+    # AND every active filter into one mask in place
+    mask = None
 
     # Date range filter using campaign dates when available
-    start = state.get("date_start")
-    end = state.get("date_end")
+    start, end = (state.get(key) for key in DATE_KEYS)
     if (
         start is not None
         and end is not None
         and {"start_date", "end_date"}.issubset(df.columns)
     ):
-        filters.append((df["start_date"] <= end) & (df["end_date"] >= start))
+        mask = (df["start_date"].to_numpy() <= pd.Timestamp(end).to_datetime64()) & (
+            df["end_date"].to_numpy() >= pd.Timestamp(start).to_datetime64()
+        )
+        if not mask.any():
+            return df.iloc[:0]
 
-    if not filters:
-        return df
+    for col, key in FILTER_MAP.items():
+        # Use .get() to avoid KeyError if missing in session_state
+        selected_values = state.get(key, [])
+        if col in df.columns and selected_values:
+            column = df[col]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                # Membership by gathering a cached lookup table with the codes
+                lut = _category_lut(
+                    tuple(column.cat.categories), tuple(selected_values)
+                )
+                matches = lut[column.array.codes]
+            else:
+                matches = column.isin(selected_values).to_numpy()
+            if mask is None:
+                mask = matches
+            else:
+                mask &= matches
+            if not mask.any():
+                return df.iloc[:0]
 
-    mask = filters[0]
-    for f in filters[1:]:
-        mask &= f
+    # Selections that keep every row return the frame without copying
+    if mask is None or mask.all():
+        return df
     return df[mask]
+
+
+if __name__ == "__main__":
+    convert_to_parquet()
@@ -1,8 +1,11 @@
 
 from __future__ import annotations
+import copy
+from functools import lru_cache
 import streamlit as st
 import pandas as pd
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Mapping, Any, Hashable, Optional
 
 COLOR_MAP = {
     "revenue": "#2ecc71",
@@ -12,39 +15,49 @@ COLOR_MAP = {
 }
 
 
+# Read-only; init_session_state hands each session its own list/dict copies
+DEFAULTS: Mapping[str, Any] = MappingProxyType({
+    "campaigns": [],
+    "categories": [],
+    "products": [],
+    "promo_types": [],
+    "cities": [],
+    "kpi_focus": "Revenue",
+    "compare_mode": False,
+    "date_start": None,
+    "date_end": None,
+    "annotations": {},
+    "selected_city": None,
+    "top_n": 10,
+    "discount_range": (0.0, 1.0),
+    "price_range": (0.0, 1_000.0),
+    "ir_range": (0.0, 1.0),
+    "inc_rev_range": (0.0, 10_000.0),
+    "show_before": True,
+    "show_after": True,
+    "positive_only": False,
+    "normalize_store": False,
+})
+
+
 def init_session_state():
-    defaults: Dict[str, Any] = {
-        "campaigns": [],
-        "categories": [],
-        "products": [],
-        "promo_types": [],
-        "cities": [],
-        "kpi_focus": "Revenue",
-        "compare_mode": False,
-        "date_start": None,
-        "date_end": None,
-        "annotations": {},
-        "selected_city": None,
-        "top_n": 10,
-        "discount_range": (0.0, 1.0),
-        "price_range": (0.0, 1_000.0),
-        "ir_range": (0.0, 1.0),
-        "inc_rev_range": (0.0, 10_000.0),
-    }
-    for k, v in defaults.items():
+    for k, v in DEFAULTS.items():
         if k not in st.session_state:
-            st.session_state[k] = v
+            st.session_state[k] = copy.copy(v) if isinstance(v, (list, dict)) else v
+
+
+# KPI name prefix -> colour; kpi_color tries the 3-char then the 2-char prefix
+_PREFIX_MAP = {
+    "rev": COLOR_MAP["revenue"],
+    "mar": COLOR_MAP["margin"],
+    "ir": COLOR_MAP["ir%"],
+}
 
 
+@lru_cache(maxsize=64)
 def kpi_color(kpi: str) -> str:
     key = kpi.strip().lower()
-    if key.startswith("rev"):
-        return COLOR_MAP["revenue"]
-    if key.startswith("mar"):
-        return COLOR_MAP["margin"]
-    if key.startswith("ir"):
-        return COLOR_MAP["ir%"]
-    return "#666"
+    return _PREFIX_MAP.get(key[:3]) or _PREFIX_MAP.get(key[:2], "#666")
 
 
 def metric_card(label: str, value: Any, delta: Optional[Any] = None, help_text: Optional[str] = None):
@@ -56,8 +69,22 @@ def metric_card(label: str, value: Any, delta: Optional[Any] = None, help_text:
             st.caption(help_text)
 
 
-def dataframe_download(df: pd.DataFrame, filename: str):
+# One entry per exported dataset; the bytes of a large frame are the bulk of it
+@st.cache_data(show_spinner=False, max_entries=16)
+def _csv_bytes(_df: pd.DataFrame, key: Hashable) -> bytes:
+    """UTF-8 CSV of ``_df``, cached on ``key`` so reruns skip re-encoding.
+
+    The leading underscore keeps ``_df`` out of the cache key, so ``key``
+    must identify its contents (e.g. the dataset alias and filter signature).
+    """
+    return _df.to_csv(index=False).encode("utf-8")
+
+
+def dataframe_download(
+    df: pd.DataFrame, filename: str, key: Optional[Hashable] = None
+):
     if df is None or df.empty:
         return
-    csv = df.to_csv(index=False).encode("utf-8")
+    # Without a key the frame is encoded on every rerun
+    csv = df.to_csv(index=False).encode("utf-8") if key is None else _csv_bytes(df, key)
     st.download_button("Export CSV", data=csv, file_name=filename, mime="text/csv")
\ No newline at end of file